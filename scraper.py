@@ -1,7 +1,9 @@
 #!/usr/bin/python3
+import concurrent.futures
 import dataclasses
 import datetime
 import os
+import socket
 import sys
 import threading
 import time
@@ -9,7 +11,7 @@ import requests
 
 from ipaddress import IPv4Address, IPv6Address, ip_address
 from functools import lru_cache
-from typing import Dict, Union, Any, List, Optional
+from typing import Dict, Union, Any, List, Optional, Tuple
 from easysnmp import Session
 from influxdb import InfluxDBClient
 from influxdb.exceptions import InfluxDBClientError
@@ -17,6 +19,11 @@ from influxdb.exceptions import InfluxDBClientError
 
 import yaml
 
+try:
+    from yaml import CSafeLoader
+except ImportError:
+    from yaml import SafeLoader as CSafeLoader
+
 
 class Error(Exception):
     """Base Exception handling class."""
@@ -31,9 +38,22 @@ requests.packages.urllib3.disable_warnings()
 SNMP_TO_INFLUX_CONFIG_OS_ENV = "SNMP_TO_INFLUX_CONFIG_FILE"
 SNMP_TO_INFLUX_CONFIG_DEFAULT_LOCATION = "./scraper.yaml"
 _POLLING_FREQUENCY = datetime.timedelta(seconds=60)
-
-
-@dataclasses.dataclass
+_POLL_TIMEOUT = datetime.timedelta(seconds=55)
+_MAX_POLLERS = 32
+_MAX_OVERRUNS = 3
+_INFLUX_BATCH_SIZE = 5000
+_BULK_MAX_REPETITIONS = 50
+_UDP_MAX_DATAGRAM = 1400
+
+_cached_config = None
+_cached_config_lock = threading.Lock()
+_influx_client = None
+_influx_client_lock = threading.Lock()
+
+
+# The config classes are frozen and declare __slots__ by hand, which is what
+# dataclass(slots=True) would generate on Python 3.10+.
+@dataclasses.dataclass(frozen=True)
 class Device:
     """A representation of a Device in Configuration file.
     Attributes:
@@ -42,18 +62,18 @@ class Device:
         ip: Union[IPv4Network, IPv6Network]
     """
 
+    __slots__ = ("hostname", "community", "ip", "username", "password", "extra_oids")
+
     hostname: str
     community: str
     ip: Union[IPv4Address, IPv6Address]
     username: str
     password: str
-    extra_oids: List[str]
+    extra_oids: Tuple[str, ...]
 
     @classmethod
     def from_dict(cls, device_cfg: Dict[str, str]) -> "Device":
-        oids = []
-        for entry in device_cfg["extra_oids"]:
-            oids.append(entry)
+        oids = tuple(device_cfg["extra_oids"])
         return cls(
             hostname=device_cfg["hostname"],
             community=device_cfg["community"],
@@ -64,14 +84,16 @@ class Device:
         )
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Devices:
     """A representation of the configuration file.
     Attributes:
         devices: List of all devices
     """
 
-    devices: List[Device]
+    __slots__ = ("devices",)
+
+    devices: Tuple[Device, ...]
 
     @classmethod
     def from_dict(cls, cfg: List[Device]) -> "Devices":
@@ -81,13 +103,11 @@ class Devices:
         Returns:
             A Config object.
         """
-        devices = []
-        for entry in cfg:
-            devices.append(Device.from_dict(entry))
+        devices = tuple(Device.from_dict(entry) for entry in cfg)
         return cls(devices=devices)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Influxdb:
     """A representation of a Device in Configuration file.
     Attributes:
@@ -96,22 +116,29 @@ class Influxdb:
         ip: Union[IPv4Network, IPv6Network]
     """
 
+    __slots__ = ("uri", "username", "password", "database", "udp_host", "udp_port")
+
     uri: str
     username: str
     password: str
     database: str
+    udp_host: Optional[str]
+    udp_port: Optional[int]
 
     @classmethod
     def from_dict(cls, influxdb_cfg: Dict[str, str]) -> "Influxdb":
+        udp_port = influxdb_cfg.get("udp_port")
         return cls(
             uri=influxdb_cfg["uri"],
             username=influxdb_cfg["username"],
             password=influxdb_cfg["password"],
             database=influxdb_cfg["database"],
+            udp_host=influxdb_cfg.get("udp_host"),
+            udp_port=int(udp_port) if udp_port else None,
         )
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Config:
     """A representation of the configuration file.
     Attributes:
@@ -120,6 +147,8 @@ class Config:
         influxdb: The Influxdb configuration.
     """
 
+    __slots__ = ("default_community", "devices", "influxdb")
+
     default_community: str
     devices: List[Devices]
     influxdb: Influxdb
@@ -148,34 +177,66 @@ def is_integer(n):
     else:
         return float(n).is_integer()
 
-@lru_cache(maxsize=10)
-def fetch_from_config(key: str) -> Optional[Union[Dict[str, Any], List[str]]]:
-    """Fetches a specific key from configuration.
-    Arguments:
-        key: The named key to fetch.
+def load_config() -> Config:
+    """Fetches and validates configuration file from disk.
     Returns:
-        The config value associated with the key
+        A Config object.
     """
-    return load_config().get(key)
+    return _load_cached_config()[1]
 
 
-def load_config() -> Dict[str, str]:
-    """Fetches and validates configuration file from disk.
+def get_devices() -> Devices:
+    """Fetches the configured devices.
     Returns:
-        Linted configuration file.
+        A Devices object.
     """
-    cfg_contents = fetch_config_from_disk()
-    try:
-        config = yaml.safe_load(cfg_contents)
-    except yaml.YAMLError as e:
-        print("Failed to load YAML file: %s", e)
-        sys.exit(1)
+    return load_config().devices
+
+
+def get_influx_cfg() -> Influxdb:
+    """Fetches the InfluxDB configuration.
+    Returns:
+        An Influxdb object.
+    """
+    return load_config().influxdb
+
+
+def _load_cached_config() -> Tuple[Tuple[str, int, int], Config]:
+    """Parses the configuration file, reusing the last result until it changes.
+    Returns:
+        A (path, mtime, size) key and the Config object.
+    """
+    global _cached_config
+    config_file = config_file_location()
     try:
-        _ = Config.from_dict(config)
-        return config
-    except (KeyError, TypeError) as e:
-        print("Failed to lint file: %s", e)
-        sys.exit(2)
+        stat = os.stat(config_file)
+    except FileNotFoundError as e:
+        raise ConfigFileNotFoundError(
+            f"Could not locate configuration file in {config_file}"
+        ) from e
+    # The size catches rewrites within the filesystem's mtime granularity.
+    key = (config_file, stat.st_mtime_ns, stat.st_size)
+    with _cached_config_lock:
+        if _cached_config is None or _cached_config[0] != key:
+            cfg_contents = fetch_config_from_disk()
+            try:
+                config = yaml.load(cfg_contents, Loader=CSafeLoader)
+            except yaml.YAMLError as e:
+                print("Failed to load YAML file: %s", e)
+                sys.exit(1)
+            try:
+                _cached_config = (key, Config.from_dict(config))
+            except (KeyError, TypeError) as e:
+                print("Failed to lint file: %s", e)
+                sys.exit(2)
+        return _cached_config
+
+
+def config_file_location() -> str:
+    """Returns the path of the configuration file."""
+    return os.environ.get(
+        SNMP_TO_INFLUX_CONFIG_OS_ENV, SNMP_TO_INFLUX_CONFIG_DEFAULT_LOCATION
+    )
 
 
 def fetch_config_from_disk() -> str:
@@ -185,9 +246,7 @@ def fetch_config_from_disk() -> str:
     Returns:
         The file contents as string.
     """
-    config_file = os.environ.get(
-        SNMP_TO_INFLUX_CONFIG_OS_ENV, SNMP_TO_INFLUX_CONFIG_DEFAULT_LOCATION
-    )
+    config_file = config_file_location()
     try:
         with open(config_file, "r") as stream:
             return stream.read()
@@ -200,15 +259,44 @@ def extraOIDs(session: Session, device_cfg: Device) -> bool:
     try:
         return(pollExtraOIDs(session, device_cfg.hostname, device_cfg.extra_oids))
     except Exception as e:
+        print(f"ERROR - polling extra OIDs of {device_cfg.hostname} failed: {e}")
         return False
 
 
+# Sessions are cached per device so net-snmp setup and, for SNMPv3, key
+# localization happen once instead of on every poll. Numeric OIDs skip the
+# MIB name lookup for every returned varbind.
+@lru_cache(maxsize=512)
+def snmpv2_session(device_cfg: Device) -> Session:
+    """Returns the cached SNMPv2 session for a device."""
+    return Session(
+        hostname=str(device_cfg.ip),
+        community=device_cfg.community,
+        version=2,
+        use_numeric=True,
+    )
+
+
+@lru_cache(maxsize=512)
+def snmpv3_session(device_cfg: Device) -> Session:
+    """Returns the cached SNMPv3 session for a device."""
+    return Session(
+        hostname=str(device_cfg.ip),
+        version=3,
+        security_level="auth_with_privacy",
+        security_username=device_cfg.username,
+        auth_protocol="SHA",
+        auth_password=device_cfg.password,
+        privacy_protocol="AES",
+        privacy_password=device_cfg.password,
+        use_numeric=True,
+    )
+
+
 def SNMPpollv2(device_cfg: Device) -> bool:
     """Polls a device via SNMPv2."""
     try:
-        session = Session(
-            hostname=str(device_cfg.ip), community=device_cfg.community, version=2
-        )
+        session = snmpv2_session(device_cfg)
         if device_cfg.extra_oids:
             extraOIDs(session, device_cfg)
         return pollDevice(session, device_cfg.hostname)
@@ -219,16 +307,7 @@ def SNMPpollv2(device_cfg: Device) -> bool:
 def SNMPpollv3(device_cfg: Device) -> bool:
     """Polls a device via SNMPv3."""
     try:
-        session = Session(
-            hostname=str(device_cfg.ip),
-            version=3,
-            security_level="auth_with_privacy",
-            security_username=device_cfg.username,
-            auth_protocol="SHA",
-            auth_password=device_cfg.password,
-            privacy_protocol="AES",
-            privacy_password=device_cfg.password,
-        )
+        session = snmpv3_session(device_cfg)
         return pollDevice(session, device_cfg.hostname)
     except Exception as e:
         raise ValueError("ERROR - SNMPv3 error" + str(e)) from e
@@ -244,6 +323,13 @@ _ifInErrors = "14"
 _ifOutErrors = "20"
 _ifDescr = "2"
 
+# Characters that need a backslash in line protocol tag keys, tag values and
+# field keys.
+_TAG_ESCAPES = str.maketrans(
+    {"\\": "\\\\", ",": "\\,", " ": "\\ ", "=": "\\=", "\n": "\\n"}
+)
+
+_IFNAME_OID = f"{_ifXEntry}.{_ifName}"
 _OIDS = {
     "_ifHCInOctets": f"{_ifXEntry}.{_ifHCInOctets}",
     "_ifHCOutOctets": f"{_ifXEntry}.{_ifHCOutOctets}",
@@ -252,90 +338,215 @@ _OIDS = {
     "_ifDescr": f"{_ifTable}.{_ifDescr}",
 }
 
+
+def make_line(
+    measurement: str, tags: Dict[str, str], fields: Dict[str, int], timestamp: int
+) -> str:
+    """Formats a point as InfluxDB line protocol.
+    Arguments:
+        measurement: The measurement name.
+        tags: The tag values by key, empty values are left out.
+        fields: The integer field values by key.
+        timestamp: The point's time in nanoseconds since the epoch.
+    Returns:
+        The point as a single line.
+    """
+    tag_set = "".join(
+        f",{key.translate(_TAG_ESCAPES)}={value.translate(_TAG_ESCAPES)}"
+        for key, value in tags.items()
+        if value
+    )
+    field_set = ",".join(
+        f"{key.translate(_TAG_ESCAPES)}={value}i" for key, value in fields.items()
+    )
+    return f"{measurement}{tag_set} {field_set} {timestamp}"
+
+
 def pollExtraOIDs(session: Session, hostname: str, extra_oids: List[str]) -> bool:
     output = dict()
     for oid in extra_oids:
         output[oid] = session.walk(oid)
+    timestamp = time.time_ns()
+    dbpayload = []
     for oid_name,oid_output in output.items():
-        dbpayload = [
-            {
-                "measurement": "extra_oids",
-                "tags": {
-                    "host": hostname,
-                    "oid": oid_name,
-                },
-                "time": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "fields": {
-                },
-            }
-        ]
+        fields = dict()
         for output in oid_output:
-            dbpayload[0]["fields"][output.oid] = (int(output.value) if is_integer(output.value) else 0)
-        try:
-            upload_to_influx(dbpayload)
-        except:
-            return False
+            fields[output.oid] = (int(output.value) if is_integer(output.value) else 0)
+        if not fields:
+            continue
+        dbpayload.append(
+            make_line(
+                "extra_oids",
+                {"host": hostname, "oid": oid_name},
+                fields,
+                timestamp,
+            )
+        )
+    try:
+        upload_to_influx(dbpayload)
+    except Exception as e:
+        print(f"ERROR - upload for {hostname} failed: {e}")
+        return False
     return True
 
+
+def _oid_index(varbind: Any) -> str:
+    """Returns the table index of a varbind returned by a walk."""
+    return varbind.oid_index if varbind.oid_index else varbind.oid.rpartition(".")[2]
+
+
 def pollDevice(session: Session, hostname: str) -> bool:
 
     interfaces = dict()
-    for interface in session.walk(f"{_ifXEntry}.{_ifName}"):
-        interfaces[interface.value] = {
-            "oid_index": interface.oid_index
-            if interface.oid_index
-            else interface.oid.split(".")[-1]
-        }
+    for interface in session.bulkwalk(
+        _IFNAME_OID, max_repetitions=_BULK_MAX_REPETITIONS
+    ):
+        interfaces[interface.value] = _oid_index(interface)
 
+    # One GETBULK walk per column instead of one GET per interface and column.
+    columns = dict()
     for oid_name, oid in _OIDS.items():
-        for name, _ in interfaces.items():
-            snmp_info = session.get(f"{oid}.{interfaces[name]['oid_index']}")
-            interfaces[name].update({oid_name: snmp_info.value})
-    for name, values in interfaces.items():
-        dbpayload = [
-            {
-                "measurement": "interface_stats",
-                "tags": {
+        columns[oid_name] = {
+            _oid_index(entry): entry.value
+            for entry in session.bulkwalk(oid, max_repetitions=_BULK_MAX_REPETITIONS)
+        }
+        if interfaces and not columns[oid_name]:
+            print(f"WARNING - {hostname} returned no rows for {oid_name} ({oid})")
+    descriptions = columns["_ifDescr"]
+    in_octets = columns["_ifHCInOctets"]
+    out_octets = columns["_ifHCOutOctets"]
+    in_errors = columns["_ifInErrors"]
+    out_errors = columns["_ifOutErrors"]
+
+    # All samples of one poll share a timestamp so rates line up per device.
+    timestamp = time.time_ns()
+    dbpayload = []
+    skipped = 0
+    for name, oid_index in interfaces.items():
+        try:
+            fields = {
+                "ifin": int(in_octets[oid_index]),
+                "ifout": int(out_octets[oid_index]),
+                "ifinerr": int(in_errors[oid_index]),
+                "ifouterr": int(out_errors[oid_index]),
+            }
+            description = descriptions[oid_index]
+        except KeyError:
+            # The interface vanished or lacks a counter; skip it this poll.
+            skipped += 1
+            continue
+        dbpayload.append(
+            make_line(
+                "interface_stats",
+                {
                     "host": hostname,
                     "interface": name,
-                    "interface_description": values["_ifDescr"],
+                    "interface_description": description,
                 },
-                "time": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "fields": {
-                    "ifin": int(values["_ifHCInOctets"]),
-                    "ifout": int(values["_ifHCOutOctets"]),
-                    "ifinerr": int(values["_ifInErrors"]),
-                    "ifouterr": int(values["_ifOutErrors"]),
-                },
-            }
-        ]
-        try:
-            upload_to_influx(dbpayload)
-        except:
-            return False
+                fields,
+                timestamp,
+            )
+        )
+    if skipped:
+        print(
+            f"WARNING - {hostname}: skipped {skipped} of {len(interfaces)} "
+            "interfaces with missing counters"
+        )
+    try:
+        upload_to_influx(dbpayload)
+    except Exception as e:
+        print(f"ERROR - upload for {hostname} failed: {e}")
+        return False
     return True
 
 
-def upload_to_influx(payload: Any) -> bool:
-    """Uploads a payload to influxDB."""
-    influxdb_cfg = Config.from_dict(load_config()).influxdb
-    client = InfluxDBClient(
-        influxdb_cfg.uri,
-        443,
-        influxdb_cfg.username,
-        influxdb_cfg.password,
-        influxdb_cfg.database,
-        ssl=True,
-    )
+def get_influx_client() -> InfluxDBClient:
+    """Returns the shared InfluxDB client, rebuilding it if its config changed.
+
+    Reusing one client keeps its HTTP session, and with it the TLS
+    connection to InfluxDB, alive between polls.
+    """
+    global _influx_client
+    influxdb_cfg = get_influx_cfg()
+    with _influx_client_lock:
+        if _influx_client is None or _influx_client[0] != influxdb_cfg:
+            if _influx_client is not None:
+                _influx_client[1].close()
+            client = InfluxDBClient(
+                influxdb_cfg.uri,
+                443,
+                influxdb_cfg.username,
+                influxdb_cfg.password,
+                influxdb_cfg.database,
+                ssl=True,
+                # Size the connection pool to the number of pollers writing at
+                # once so connections are kept instead of discarded each cycle.
+                pool_size=poller_count(get_devices()),
+            )
+            _influx_client = (influxdb_cfg, client)
+        return _influx_client[1]
+
+
+def upload_to_influx(payload: List[str]) -> bool:
+    """Uploads a payload of line protocol points to influxDB."""
+    influxdb_cfg = get_influx_cfg()
     print(payload)
+    if influxdb_cfg.udp_port:
+        return upload_to_influx_udp(payload, influxdb_cfg)
+    client = get_influx_client()
     try:
-        client.write_points(payload)
+        client.write_points(
+            payload,
+            time_precision="n",
+            batch_size=_INFLUX_BATCH_SIZE,
+            protocol="line",
+        )
         return True
     except InfluxDBClientError as e:
         print(e)
         return False
 
 
+@lru_cache(maxsize=2)
+def udp_socket(family: int) -> socket.socket:
+    """Returns the UDP socket shared by all pollers for an address family."""
+    return socket.socket(family, socket.SOCK_DGRAM)
+
+
+def upload_to_influx_udp(payload: List[str], influxdb_cfg: Influxdb) -> bool:
+    """Sends a payload of line protocol points to influxDB's UDP listener.
+
+    Points are packed into datagrams that fit a single ethernet frame.
+    Delivery is not confirmed, so lost datagrams go unnoticed.
+    """
+    try:
+        family, _, _, _, address = socket.getaddrinfo(
+            influxdb_cfg.udp_host or influxdb_cfg.uri,
+            influxdb_cfg.udp_port,
+            type=socket.SOCK_DGRAM,
+        )[0]
+        sock = udp_socket(family)
+        datagram = bytearray()
+        for line in payload:
+            encoded = line.encode("utf-8")
+            if datagram and len(datagram) + len(encoded) >= _UDP_MAX_DATAGRAM:
+                sock.sendto(datagram, address)
+                datagram.clear()
+            datagram += encoded
+            datagram += b"\n"
+        if datagram:
+            sock.sendto(datagram, address)
+        return True
+    except OSError as e:
+        print(e)
+        return False
+
+
+def poller_count(devices: Devices) -> int:
+    """Returns how many devices are polled concurrently."""
+    return max(1, min(_MAX_POLLERS, len(devices.devices)))
+
+
 def StartPoll(device: Config) -> Dict[str, str]:
     """Polls a device via SNMPv2 or SNMPV3 depending on configuration."""
     if device.username:
@@ -347,15 +558,68 @@ def StartPoll(device: Config) -> Dict[str, str]:
 
 def main():
     """Starts the periodic scraper."""
-    DeviceList = Config.from_dict(load_config()).devices
-
-    while True:
-        polling_threads = [
-            threading.Thread(target=StartPoll, args=(device,))
-            for device in DeviceList.devices
-        ]
-        _ = [thread.start() for thread in polling_threads]
-        time.sleep(_POLLING_FREQUENCY.total_seconds())
+    DeviceList = get_devices()
+
+    # Pollers spend their time waiting on SNMP and InfluxDB, so one long
+    # lived pool of threads is kept instead of spawning threads every cycle.
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=poller_count(DeviceList),
+        thread_name_prefix="poller",
+    ) as executor:
+        polls = dict()
+        overruns = 0
+        next_deadline = time.monotonic()
+        while True:
+            # Polls skipped, cancelled or timed out this cycle; any of them
+            # means the pool cannot keep up with the polling interval.
+            late = 0
+            for device in DeviceList.devices:
+                previous = polls.get(device)
+                if previous is not None and not previous.done():
+                    print(
+                        f"Skipping {device.hostname} ({device.ip}): "
+                        "previous poll still running"
+                    )
+                    late += 1
+                    continue
+                polls[device] = executor.submit(StartPoll, device)
+
+            _, not_done = concurrent.futures.wait(
+                polls.values(), timeout=_POLL_TIMEOUT.total_seconds()
+            )
+            for device, future in polls.items():
+                if future in not_done:
+                    late += 1
+                    if future.cancel():
+                        print(
+                            f"Polling {device.hostname} ({device.ip}) "
+                            f"did not start within {_POLL_TIMEOUT}"
+                        )
+                    else:
+                        print(
+                            f"Polling {device.hostname} ({device.ip}) "
+                            f"exceeded {_POLL_TIMEOUT}"
+                        )
+                elif future.exception() is not None:
+                    print(
+                        f"Polling {device.hostname} ({device.ip}) failed: "
+                        f"{future.exception()}"
+                    )
+            polls = {
+                device: future for device, future in polls.items() if not future.done()
+            }
+
+            overruns = overruns + 1 if late else 0
+            if overruns >= _MAX_OVERRUNS:
+                print(f"Polling is over budget for {overruns} cycles")
+
+            # Sleep towards a fixed grid so cycles don't drift by their runtime.
+            next_deadline += _POLLING_FREQUENCY.total_seconds()
+            sleep_for = next_deadline - time.monotonic()
+            if sleep_for <= 0:
+                next_deadline = time.monotonic()
+                continue
+            time.sleep(sleep_for)
 
 
 if __name__ == "__main__":